@@ -2,33 +2,85 @@
 from __future__ import annotations
 
 import collections
+import concurrent.futures
 import csv
-import io
+import datetime
+import filecmp
 import itertools
-import json
 import logging
 import os
+import re
 import shutil
+import string
 import time
 
-from dataclasses import dataclass
-from typing import Mapping, cast
+from typing import Any, Iterable, Mapping, NamedTuple, cast
 
 import bs4
 import feedparser  # type: ignore[import]
-import requests
+import orjson
+import requests_cache
 
 
 logger = logging.getLogger(__name__)
 
 CITY = "Seattle"
 
+# Equivalent to `%b` in the default C locale, without going through
+# `time.strftime`.
+MONTH_NAMES = (
+    "Jan",
+    "Feb",
+    "Mar",
+    "Apr",
+    "May",
+    "Jun",
+    "Jul",
+    "Aug",
+    "Sep",
+    "Oct",
+    "Nov",
+    "Dec",
+)
+
+# Shared across all fetches so that requests to the same host reuse connections.
+# Responses are also cached on disk, so that rebuilding the site repeatedly
+# during development doesn't hit the network (or rate limits) every time. Data
+# that rarely changes is cached for longer. The blog feed is instead
+# revalidated on every build with a conditional request (using its
+# `ETag`/`Last-Modified`), so a new post shows up immediately but an unchanged
+# feed isn't downloaded again.
+session = requests_cache.CachedSession(
+    "build_cache",
+    expire_after=datetime.timedelta(hours=1),
+    urls_expire_after={
+        "blog.waleedkhan.name/feed.xml": requests_cache.EXPIRE_IMMEDIATELY,
+        "api.github.com": datetime.timedelta(minutes=10),
+        "resume.waleedkhan.name": datetime.timedelta(days=1),
+        re.compile(
+            r"api\.youneedabudget\.com/v1/budgets/[^/]+/categories$"
+        ): datetime.timedelta(days=1),
+    },
+)
+
+
+def format_date(year: int, month: int, day: int) -> str:
+    # Same output as `time.strftime("%b %d, %Y", ...)`.
+    return f"{MONTH_NAMES[month - 1]} {day:02d}, {year}"
+
+
+def test_format_date() -> None:
+    assert format_date(2024, 1, 5) == "Jan 05, 2024"
+    assert format_date(2023, 12, 31) == "Dec 31, 2023"
+
 
 def get_blog_info() -> Mapping[str, str]:
-    feed = feedparser.parse("https://blog.waleedkhan.name/feed.xml")
+    result = session.get("https://blog.waleedkhan.name/feed.xml")
+    feed = feedparser.parse(result.content)
     entry = feed.entries[0]
     title = entry.title
-    date = time.strftime("%b %d, %Y", entry.published_parsed)
+    published = entry.published_parsed
+    date = format_date(published.tm_year, published.tm_mon, published.tm_mday)
     tags = " &bull; ".join(tag["term"] for tag in entry.tags)
     link = entry.link
     return {
@@ -43,19 +95,27 @@ def get_blog_info() -> Mapping[str, str]:
 
 
 def get_github_info() -> Mapping[str, str]:
-    result = requests.get(
+    result = session.get(
         "https://api.github.com/users/arxanas/events/public",
         headers={"Accept": "application/vnd.github.v3+json"},
     )
     commits = []
-    for event in result.json():
+    for event in orjson.loads(result.content):
+        # Most events (stars, comments, etc.) don't have commits, so skip them
+        # before doing any per-event work.
+        event_commits = [
+            commit
+            for commit in event["payload"].get("commits", [])
+            if commit.get("distinct", False)
+        ]
+        if not event_commits:
+            continue
         repo = event["repo"]
-        event_time = time.strftime(
-            "%b %d, %Y", time.strptime(event["created_at"].split("T")[0], "%Y-%m-%d")
-        )
-        for commit in event["payload"].get("commits", []):
-            if not commit.get("distinct", False):
-                continue
+        # `created_at` is always an ISO 8601 UTC timestamp like
+        # `2024-10-31T12:34:56Z`, so there's no need for `time.strptime`.
+        (yyyy, mm, dd) = event["created_at"][:10].split("-")
+        event_time = format_date(int(yyyy), int(mm), int(dd))
+        for commit in event_commits:
             commit_url = (
                 f"""https://github.com/{repo["name"]}/commits/{commit["sha"]}"""
             )
@@ -113,8 +173,15 @@ def get_linkedin_info() -> Mapping[str, str]:
     # The LinkedIn API doesn't provide enough information unless you're
     # approved for their Partner Program. Just scrape my resume and pretend
     # it's from LinkedIn.
-    result = requests.get("https://resume.waleedkhan.name")
-    soup = bs4.BeautifulSoup(result.content, features="html.parser")
+    result = session.get("https://resume.waleedkhan.name")
+    # Only build a tree for the current job's element, rather than the whole
+    # page. `SoupStrainer` matches against the raw `class` attribute, so match
+    # `current-job` as one of possibly several classes.
+    soup = bs4.BeautifulSoup(
+        result.content,
+        features="html.parser",
+        parse_only=bs4.SoupStrainer(class_=re.compile(r"(^|\s)current-job(\s|$)")),
+    )
     current_job = soup.find_all(class_="current-job")[0]
     job_employer = current_job.find(class_="job-employer").text
     job_description = current_job.find(class_="job-description").text
@@ -131,10 +198,10 @@ def get_linkedin_info() -> Mapping[str, str]:
 
 
 def get_stack_overflow_info() -> Mapping[str, str]:
-    result = requests.get(
+    result = session.get(
         "https://api.stackexchange.com/2.2/users/344643?site=stackoverflow"
     )
-    user_info = result.json()["items"][0]
+    user_info = orjson.loads(result.content)["items"][0]
     reputation = user_info["reputation"]
     reputation_change_month = user_info["reputation_change_month"]
     return {
@@ -160,21 +227,33 @@ This page is an activity feed of my internet presence, updated once a day.
     }
 
 
-def get_restaurant_info() -> Mapping[str, str]:
+def get_ynab_data(path: str, params: Mapping[str, str] | None = None) -> Any:
+    # All YNAB requests go to the same host through the shared session, so
+    # they reuse its pooled connections instead of each setting up TLS.
     budget_id = "last-used"
     ynab_api_key = os.environ["YNAB_API_KEY"]
-    headers = {"Authorization": f"Bearer {ynab_api_key}"}
-    category_groups = requests.get(
-        f"https://api.youneedabudget.com/v1/budgets/{budget_id}/categories",
-        headers=headers,
-    ).json()["data"]["category_groups"]
+    result = session.get(
+        f"https://api.youneedabudget.com/v1/budgets/{budget_id}{path}",
+        headers={"Authorization": f"Bearer {ynab_api_key}"},
+        params=params,
+    )
+    return orjson.loads(result.content)["data"]
+
+
+def get_restaurant_info() -> Mapping[str, str]:
+    category_groups = get_ynab_data("/categories")["category_groups"]
+
+    category_name_to_id: dict[str, str] = {}
+    for category_group in category_groups:
+        for category in category_group["categories"]:
+            # Keep the first match if a name appears in several groups.
+            category_name_to_id.setdefault(category["name"], category["id"])
 
     def get_category_id(category_name: str) -> str:
-        for category_group in category_groups:
-            for category in category_group["categories"]:
-                if category["name"] == category_name:
-                    return category["id"]
-        raise ValueError(f"Could not find YNAB category: {category_name}")
+        try:
+            return category_name_to_id[category_name]
+        except KeyError:
+            raise ValueError(f"Could not find YNAB category: {category_name}") from None
 
     category_names = ["Eating Out", "Coffee"]
     category_ids = [get_category_id(category_name) for category_name in category_names]
@@ -182,38 +261,47 @@ def get_restaurant_info() -> Mapping[str, str]:
     year = int(time.strftime("%Y")) - 1
     month = time.strftime("%m")
     since_date = f"{year}-{month}-01"
-    transactions = itertools.chain.from_iterable(
-        requests.get(
-            f"https://api.youneedabudget.com/v1/budgets/{budget_id}/categories/{category_id}/transactions",
-            headers=headers,
+
+    def get_category_transactions(category_id: str) -> list[dict[str, Any]]:
+        return get_ynab_data(
+            f"/categories/{category_id}/transactions",
             params={
                 "since_date": since_date,
             },
-        ).json()["data"]["transactions"]
-        for category_id in category_ids
-    )
+        )["transactions"]
+
+    with concurrent.futures.ThreadPoolExecutor(
+        max_workers=len(category_ids)
+    ) as executor:
+        transactions = list(
+            itertools.chain.from_iterable(
+                executor.map(get_category_transactions, category_ids)
+            )
+        )
 
-    payees = collections.defaultdict(list)
+    payee_visits: collections.Counter[str] = collections.Counter()
+    payee_spend: dict[str, int] = collections.defaultdict(int)
     for transaction in transactions:
-        payees[transaction["payee_name"]].append(transaction)
-    top_payees = sorted(payees.items(), key=lambda kv: len(kv[1]), reverse=True)[:10]
+        payee_name = transaction["payee_name"]
+        payee_visits[payee_name] += 1
+        payee_spend[payee_name] -= transaction["amount"]
 
-    table_rows_html = ""
-    for payee_name, payee_transactions in top_payees:
+    table_rows = []
+    for payee_name, num_payee_transactions in payee_visits.most_common(10):
         payee_href = (
             f"""http://google.com/maps/search/{CITY}+{payee_name.replace(" ", "+")}"""
         )
-        num_payee_transactions = len(payee_transactions)
-        total_spent_at_payee = (
-            -sum(transaction["amount"] for transaction in payee_transactions) / 1000
-        )
-        table_rows_html += f"""\
+        total_spent_at_payee = payee_spend[payee_name] / 1000
+        table_rows.append(
+            f"""\
 <tr>
 <td><a href="{payee_href}">{payee_name}</a></td>
 <td>{num_payee_transactions}</td>
 <td>${total_spent_at_payee:.2f}</td>
 </tr>
 """
+        )
+    table_rows_html = "".join(table_rows)
 
     return {
         "restaurants": f"""\
@@ -302,56 +390,101 @@ def make_redirect_html(path: str, target_url: str) -> str:
 """
 
 
-def get_budget_info() -> Mapping[str, str]:
+def write_file(path: str, contents: str) -> None:
+    # Only write the file if its contents changed, so that rebuilding the site
+    # doesn't touch unchanged files (or their modification times).
+    try:
+        with open(path) as f:
+            if f.read() == contents:
+                return
+    except FileNotFoundError:
+        pass
+    with open(path, "w") as f:
+        f.write(contents)
+
+
+def write_csv_file(path: str, rows: Iterable[list[object]]) -> None:
+    # The rows are streamed, so write them to a temporary file and only move it
+    # into place if it differs from the existing file.
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w", newline="") as f:
+        csv.writer(f).writerows(rows)
+    if os.path.exists(path) and filecmp.cmp(temp_path, path, shallow=False):
+        os.remove(temp_path)
+    else:
+        os.replace(temp_path, path)
+
+
+def copy_file(src: str, dst: str) -> None:
+    if os.path.exists(dst) and filecmp.cmp(src, dst, shallow=False):
+        return
+    shutil.copyfile(src=src, dst=dst)
+
+
+def remove_stale_files(root: str, keep_paths: set[str]) -> None:
+    keep_paths = {os.path.normpath(path) for path in keep_paths}
+    for dir_path, _dir_names, file_names in os.walk(root, topdown=False):
+        for file_name in file_names:
+            path = os.path.normpath(os.path.join(dir_path, file_name))
+            if path not in keep_paths:
+                os.remove(path)
+        if dir_path != root and not os.listdir(dir_path):
+            os.rmdir(dir_path)
+
+
+def get_budget_info() -> Mapping[str, Iterable[list[object]]]:
     tx_file_path = os.environ.get("YNAB_TRANSACTIONS_FILE")
     if tx_file_path is None:
         logging.info("Fetching budget info from YNAB")
-        budget_id = "last-used"
-        ynab_api_key = os.environ["YNAB_API_KEY"]
-        headers = {"Authorization": f"Bearer {ynab_api_key}"}
-        transactions = requests.get(
-            f"https://api.youneedabudget.com/v1/budgets/{budget_id}/transactions",
-            headers=headers,
-        ).json()["data"]["transactions"]
+        transactions = get_ynab_data("/transactions")["transactions"]
         parsed_budget_info = parse_budget_info(transactions)
     else:
         logging.info(f"Reading budget info from file: {tx_file_path}")
-        with open(tx_file_path) as f:
-            transactions = json.load(f)["data"]["transactions"]
+        with open(tx_file_path, "rb") as f:
+            transactions = orjson.loads(f.read())["data"]["transactions"]
             parsed_budget_info = parse_budget_info(transactions)
 
-    temp = io.StringIO()
-    writer = csv.writer(temp)
-    for key, amount in parsed_budget_info.items():
-        writer.writerow([key.category_name, key.year, key.month, amount])
+    # Rows are written straight to the output file by `main`, rather than
+    # rendered to an intermediate string here.
     return {
-        "budget.csv": temp.getvalue(),
+        "budget.csv": (
+            [key.category_name, key.year, key.month, amount]
+            for key, amount in parsed_budget_info.items()
+        ),
     }
 
 
-@dataclass(eq=True, frozen=True)
-class BudgetKey:
+# A `NamedTuple` rather than a frozen dataclass, so that constructing, hashing
+# and comparing keys is done by the built-in tuple implementation.
+class BudgetKey(NamedTuple):
     category_name: str
     year: int
     month: int
 
 
-def parse_budget_info(transactions: list[dict[str, object]]) -> dict[BudgetKey, float]:
-    result: dict[BudgetKey, float] = collections.defaultdict(float)
+def parse_budget_info(
+    transactions: Iterable[Mapping[str, object]],
+) -> dict[BudgetKey, float]:
+    # Sum by the raw category name and `YYYY-MM` date prefix first, so that
+    # date parsing and key construction happen once per group rather than once
+    # per transaction.
+    totals: dict[tuple[str, str], float] = collections.defaultdict(float)
     for tx in transactions:
         category_name = cast(str, tx["category_name"])
         date = cast(str, tx["date"])
-        (yyyy, mm, _dd) = date.split("-")
-        year = int(yyyy)
-        month = int(mm)
-        key = BudgetKey(category_name=category_name, year=year, month=month)
         amount = cast(float, tx["amount"])
-        result[key] += amount
+        totals[(category_name, date[:7])] += amount
+
+    result: dict[BudgetKey, float] = {}
+    for (category_name, year_month), amount in totals.items():
+        (yyyy, mm) = year_month.split("-")
+        key = BudgetKey(category_name=category_name, year=int(yyyy), month=int(mm))
+        result[key] = amount
     return result
 
 
 def test_parse_budget_info() -> None:
-    txs = json.loads(
+    txs = orjson.loads(
         """
 [{"id":"312a883c-0beb-add6-9378-cb8cc02e0a4f","date":"2016-10-31","amount":-5000,"memo":"DigitalOcean","cleared":"reconciled","approved":true,"flag_color":null,"account_id":"91686979-1e98-8aa9-0b80-cb8cc02bf67d","account_name":"Chase Checking","payee_id":"2766379f-f9b5-fc8a-ea0f-cb8cc02c0d8c","payee_name":"DigitalOcean","category_id":"cd0408d5-aa60-caf9-6a00-cb8cc02a904e","category_name":"Online Subscriptions","transfer_account_id":null,"transfer_transaction_id":null,"matched_transaction_id":null,"import_id":null,"import_payee_name":null,"import_payee_name_original":null,"debt_transaction_type":null,"deleted":false,"subtransactions":[]},{"id":"802e3ddd-08bb-457c-81c0-4ea0cfd54043","date":"2016-10-31","amount":0,"memo":null,"cleared":"cleared","approved":true,"flag_color":null,"account_id":"c448ab40-f260-4d54-85a4-6f8677c221b4","account_name":"Fidelity 401(k)","payee_id":"36de9a0f-6bea-0171-947d-cb8cc02ce207","payee_name":"Starting Balance","category_id":null,"category_name":"Uncategorized","transfer_account_id":null,"transfer_transaction_id":null,"matched_transaction_id":null,"import_id":null,"import_payee_name":null,"import_payee_name_original":null,"debt_transaction_type":null,"deleted":false,"subtransactions":[]},{"id":"48ad5404-e255-4c50-8dcf-1b538bbf64e1","date":"2016-10-31","amount":0,"memo":null,"cleared":"cleared","approved":true,"flag_color":null,"account_id":"3bd26791-652f-4957-8eee-6b47aeea7011","account_name":"Payroll Deductions","payee_id":"36de9a0f-6bea-0171-947d-cb8cc02ce207","payee_name":"Starting Balance","category_id":"908b86be-7277-55cd-9dc7-cb8cc02769f6","category_name":"Inflow: Ready to Assign","transfer_account_id":null,"transfer_transaction_id":null,"matched_transaction_id":null,"import_id":null,"import_payee_name":null,"import_payee_name_original":null,"debt_transaction_type":null,"deleted":false,"subtransactions":[]}]
 """
@@ -366,42 +499,75 @@ def test_parse_budget_info() -> None:
 def main() -> None:
     logging.basicConfig(level=logging.INFO)
 
-    datas = {
-        **get_budget_info(),
-    }
-
-    infos = {
-        **get_blog_info(),
-        **get_github_info(),
-        **get_resume_info(),
-        **get_linkedin_info(),
-        **get_stack_overflow_info(),
-        **get_restaurant_info(),
-        **get_last_updated_info(),
-    }
+    # The fetches are independent and dominated by network latency, so run
+    # them concurrently.
+    with concurrent.futures.ThreadPoolExecutor() as executor:
+        data_futures = [executor.submit(get_budget_info)]
+        info_futures = [
+            executor.submit(get_info)
+            for get_info in [
+                get_blog_info,
+                get_github_info,
+                get_resume_info,
+                get_linkedin_info,
+                get_stack_overflow_info,
+                get_restaurant_info,
+                get_last_updated_info,
+            ]
+        ]
+        datas: dict[str, Iterable[list[object]]] = {}
+        for data_future in data_futures:
+            datas.update(data_future.result())
+        infos: dict[str, str] = {}
+        for info_future in info_futures:
+            infos.update(info_future.result())
     with open("index.template.html") as f:
-        template_html = f.read()
-    for k, v in infos.items():
-        k = "{" + k + "}"
-        template_html = template_html.replace(k, v)
-
-    shutil.rmtree("_site", ignore_errors=True)
-    os.mkdir("_site")
-    with open("_site/index.html", "w") as f:
-        f.write(template_html)
-
-    os.mkdir("_site/data")
-    for path, data in datas.items():
-        with open(f"_site/data/{path}", "w") as f:
-            f.write(data)
-
-    for path, target_url in get_redirects().items():
+        template = string.Template(f.read())
+    template_html = template.substitute(infos)
+
+    # Rather than deleting and recreating `_site` on every build, update it in
+    # place and remove whatever is left over from previous builds at the end.
+    output_paths: set[str] = set()
+
+    os.makedirs("_site", exist_ok=True)
+    write_file("_site/index.html", template_html)
+    output_paths.add("_site/index.html")
+
+    os.makedirs("_site/data", exist_ok=True)
+    for path, rows in datas.items():
+        write_csv_file(f"_site/data/{path}", rows)
+        output_paths.add(f"_site/data/{path}")
+
+    redirects = get_redirects()
+    # Create all of the directories up front, parents before children, so that
+    # writing the redirect pages below is just a series of file writes.
+    for path in sorted(redirects):
         os.makedirs(f"_site/{path}", exist_ok=True)
-        with open(f"_site/{path}/index.html", "w") as f:
-            f.write(make_redirect_html(path, target_url))
 
-    for static_file in os.listdir("_static"):
-        shutil.copy(src=os.path.join("_static", static_file), dst="_site")
+    # Writing many small files is latency-bound, so issue the writes from a
+    # thread pool.
+    with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
+        write_futures = []
+        for path, target_url in redirects.items():
+            redirect_path = f"_site/{path}/index.html"
+            write_futures.append(
+                executor.submit(
+                    write_file, redirect_path, make_redirect_html(path, target_url)
+                )
+            )
+            output_paths.add(redirect_path)
+        with os.scandir("_static") as entries:
+            for entry in entries:
+                static_path = os.path.join("_site", entry.name)
+                write_futures.append(
+                    executor.submit(copy_file, entry.path, static_path)
+                )
+                output_paths.add(static_path)
+        # Re-raise any errors from the writes.
+        for write_future in write_futures:
+            write_future.result()
+
+    remove_stale_files("_site", output_paths)
 
 
 if __name__ == "__main__":